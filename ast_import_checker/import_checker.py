@@ -16,16 +16,25 @@ relative_module ::=  "."* module | "."+
 """
 import argparse
 import ast
+import hashlib
 import json
+import os
+import re
 import sys
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from dataclasses import field
 from pathlib import Path
 from typing import Any
 from typing import Dict
+from typing import FrozenSet
+from typing import Iterator
 from typing import List
 from typing import Optional
 from typing import Set
+from typing import Tuple
+from typing import Union
 
 import pytest
 
@@ -77,8 +86,176 @@ from ast_import_checker.import_test_6.import_test_6 import (
 #     library_dependencies: module.submodule.submodule
 #     specific_submodules_imported: module.submodule.submodule.object
 
+# sys.stdlib_module_names is new in python 3.10, and only has top-level names.
+# https://docs.python.org/3/library/sys.html#sys.stdlib_module_names
+_STDLIB = frozenset(sys.stdlib_module_names)
 
-@dataclass
+# Version of what's stored in the on-disk cache. Bump it whenever that, or the
+# way it's worked out, changes.
+_CACHE_FORMAT = 2
+
+# Lines that could start an import statement, including ones that follow a
+# semicolon or a colon (e.g. "try: import foo") or a UTF-8 byte order mark.
+_IMPORT_RE = re.compile(
+    rb"(?:\A\xef\xbb\xbf|^|[;:])[ \t\f]*(?:import|from)\b", re.MULTILINE
+)
+# Old Mac-style line endings, which _IMPORT_RE doesn't know are line breaks.
+_BARE_CR_RE = re.compile(rb"\r(?!\n)")
+
+
+def _compile_ast(source: bytes, filename: str) -> ast.AST:
+    """Same as ast.parse, minus its keyword handling
+
+    Don't inherit this module's __future__ flags, and don't ask for type
+    comments.
+    """
+    return compile(source, filename, "exec", flags=ast.PyCF_ONLY_AST, dont_inherit=True)
+
+
+def _cache_file(
+    cache_dir: Optional[Path], resolved: str, include_stdlib_modules: bool
+) -> Optional[Path]:
+    """Where a file's dependencies are cached, if anywhere
+
+    There's one entry per file (and setting, cache format and Python
+    version), which is overwritten whenever the file changes, so stale
+    entries don't pile up.
+    """
+    if cache_dir is None:
+        return None
+    key = "\0".join(
+        [
+            str(_CACHE_FORMAT),
+            f"{sys.version_info[0]}.{sys.version_info[1]}",
+            resolved,
+            str(include_stdlib_modules),
+        ]
+    )
+    digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return cache_dir / f"{digest}.json"
+
+
+def _load_cached(cache_file: Path, stamp: List[int]) -> Optional[Dict[str, Any]]:
+    """Load a cache entry, or None if there isn't a current one
+
+    Entries only count if they were stored for the file's current mtime
+    and size.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as cache_dir:
+    ...     parsed = PyFile(__file__, depth_limit=0, cache_dir=Path(cache_dir))
+    ...     cached = PyFile(__file__, depth_limit=0, cache_dir=Path(cache_dir))
+    ...     print(len(list(Path(cache_dir).iterdir())))
+    1
+    >>> cached.get_dependencies() == parsed.get_dependencies()
+    True
+    """
+    try:
+        with cache_file.open("r", encoding="utf-8") as readfile:
+            cached = json.load(readfile)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get("stamp") != stamp:
+        return None
+    return cached
+
+
+def _fetch(
+    path: Path, cache_file: Optional[Path]
+) -> Tuple[List[int], Union[Dict[str, Any], bytes]]:
+    """Get a file's cache entry if it's current, or else read its source
+
+    Returns the file's mtime/size stamp (empty without a cache), along with
+    either its cache entry or its source. Safe to run in the background.
+    """
+    if cache_file is None:
+        return [], path.read_bytes()
+    stat = path.stat()
+    stamp = [stat.st_mtime_ns, stat.st_size]
+    cached = _load_cached(cache_file, stamp)
+    return stamp, cached if cached is not None else path.read_bytes()
+
+
+def _exists(path: str, listings: Dict[str, FrozenSet[str]]) -> bool:
+    """Whether the given path is in its directory's listing
+
+    Looking a module up tends to probe the same few directories over and
+    over, so each of them is listed once per traversal (and kept in
+    listings) instead of stat'ing every candidate.
+
+    >>> _exists(__file__, {})
+    True
+    >>> _exists(os.path.join(os.path.dirname(__file__), "import_test_0.py"), {})
+    False
+    >>> _exists("not_a_directory/import_test_0.py", {})
+    False
+    """
+    dirpath, name = os.path.split(path)
+    entries = listings.get(dirpath)
+    if entries is None:
+        try:
+            entries = frozenset(os.listdir(dirpath or "."))
+        except OSError:
+            entries = frozenset()
+        listings[dirpath] = entries
+    return name in entries
+
+
+class _ImportCollector:  # pylint: disable=too-few-public-methods
+    """Collect the import statements of a module
+
+    Imports are statements, so only statement bodies are visited; expressions
+    can never contain one and are skipped entirely. This runs once per file,
+    so rather than ast.NodeVisitor's method lookup by class name for every
+    node, it walks an explicit stack and dispatches on the node's type.
+
+    >>> collector = _ImportCollector()
+    >>> collector.visit(ast.parse(
+    ...     "import a\\nif b:\\n    import c\\nelse:\\n    from d import e\\n"
+    ...     "def f():\\n    try:\\n        import g\\n    except ImportError:\\n"
+    ...     "        import h\\nx = [i for i in range(3)]\\n"
+    ... ))
+    >>> [alias.name for item in collector.imports for alias in item.names]
+    ['a', 'c', 'g', 'h']
+    >>> [item.module for item in collector.importfroms]
+    ['d']
+    """
+
+    # Fields of compound statements (and except/case clauses) that hold
+    # lists of statements.
+    _BLOCK_FIELDS = ("body", "orelse", "handlers", "finalbody", "cases")
+    # Which of those fields each node type has, filled in as types are seen.
+    _blocks_by_type: Dict[type, Tuple[str, ...]] = {}
+
+    def __init__(self):
+        self.imports: List[ast.Import] = []
+        self.importfroms: List[ast.ImportFrom] = []
+
+    def visit(self, node: ast.AST):
+        blocks_by_type = self._blocks_by_type
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            # pylint: disable=unidiomatic-typecheck
+            if type(node) is ast.Import:
+                self.imports.append(node)
+            elif type(node) is ast.ImportFrom:
+                self.importfroms.append(node)
+            else:
+                node_type = type(node)
+                blocks = blocks_by_type.get(node_type)
+                if blocks is None:
+                    blocks = blocks_by_type[node_type] = tuple(
+                        block
+                        for block in reversed(self._BLOCK_FIELDS)
+                        if block in node_type._fields
+                    )
+                # Push in reverse so that statements come off in source order.
+                for block in blocks:
+                    stack.extend(reversed(getattr(node, block)))
+
+
+@dataclass(slots=True)
 class PyFile:
     """Class to represent a python file
     >>> myfile = PyFile(__file__, depth_limit=0, include_stdlib_modules=True)
@@ -91,11 +268,15 @@ class PyFile:
         "ast_import_checker.import_test_4",
         "ast_import_checker.import_test_5",
         "ast_import_checker.import_test_6.import_test_6",
+        "concurrent.futures",
         "dataclasses",
+        "hashlib",
         "import_test_1",
         "json",
+        "os",
         "pathlib",
         "pytest",
+        "re",
         "sys",
         "typing"
     ]
@@ -118,14 +299,44 @@ class PyFile:
     depth: int = 0
     depth_limit: int = 1
     include_stdlib_modules: bool = True
+    # Where to cache each file's dependencies between runs, if anywhere.
+    cache_dir: Optional[Path] = None
     library_dependencies: Set = field(default_factory=set)
     specific_submodules_imported: Set = field(default_factory=set)
     imported_files: Dict[str, Any] = field(default_factory=dict)
-    _raw_import: List[ast.Import] = field(default_factory=list)
-    _raw_importfrom: List[ast.ImportFrom] = field(default_factory=list)
+    # Every PyFile built during one traversal, keyed by resolved path, so that
+    # files imported from several places are only parsed once.
+    _cache: Dict[str, "PyFile"] = field(default_factory=dict, repr=False, compare=False)
+    # Directory listings made during the same traversal, see _exists.
+    _listings: Dict[str, FrozenSet[str]] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+    # Used to _fetch imported files in the background. When a file has
+    # already been fetched that way, the result is handed over in _fetched.
+    _executor: Optional[ThreadPoolExecutor] = field(
+        default=None, repr=False, compare=False
+    )
+    _fetched: Optional[Tuple[List[int], Union[Dict[str, Any], bytes]]] = field(
+        default=None, repr=False, compare=False
+    )
+    # Reads started during the same traversal but not yet handed over, keyed
+    # by resolved path. Each is dropped as soon as its file is built.
+    _reads: Dict[str, Future] = field(default_factory=dict, repr=False, compare=False)
+    # str() of self.path, self.path.resolve() and self.path.parent, worked out
+    # once. resolve() in particular hits the filesystem on every call.
+    _path_str: str = field(init=False, repr=False, compare=False)
+    _resolved: str = field(init=False, repr=False, compare=False)
+    _parent: str = field(init=False, repr=False, compare=False)
+    # Sorted copies of the dependency sets, as handed out by get_dependencies.
+    _sorted_libs: Optional[List[str]] = field(default=None, repr=False, compare=False)
+    _sorted_subs: Optional[List[str]] = field(default=None, repr=False, compare=False)
 
     def __post_init__(self):
         self.path = Path(self.path).expanduser()
+        self._path_str = str(self.path)
+        self._resolved = str(self.path.resolve())
+        self._parent = str(self.path.parent)
+        self._cache[self._resolved] = self
         self.resolve_dependencies()
 
     def _add_library_dependency(self, name):
@@ -136,6 +347,8 @@ class PyFile:
         >>> no_stdlib._add_library_dependency('ast')
         >>> no_stdlib._add_library_dependency('csv')
         >>> no_stdlib._add_library_dependency('hashlib')
+        >>> no_stdlib._add_library_dependency('xml.etree.ElementTree')
+        >>> no_stdlib._add_library_dependency(None)
         >>> print(json.dumps(no_stdlib.get_dependencies()[__file__]['library_dependencies'], indent=4))
         [
             "ast_import_checker",
@@ -147,17 +360,15 @@ class PyFile:
             "pytest"
         ]
         """
-        # if we're including stdlib modules, just add the dependency
-        if self.include_stdlib_modules:
-            self.library_dependencies.add(name)
-        # if we're not including stdlib modules, maybe don't
-        elif not self.include_stdlib_modules:
-            # sys.stdlib_module_names is new in python 3.10
-            # https://docs.python.org/3/library/sys.html#sys.stdlib_module_names
-            if name in sys.stdlib_module_names:
-                pass
-            else:
-                self.library_dependencies.add(name)
+        # relative imports ("from . import foo") have no module name
+        if name is None:
+            return
+        # if we're not including stdlib modules, maybe don't add it. Only
+        # top-level names are listed, so check e.g. "os" for "os.path".
+        if not self.include_stdlib_modules and name.partition(".")[0] in _STDLIB:
+            return
+        # The same names turn up in file after file, so share one copy of each.
+        self.library_dependencies.add(sys.intern(name))
 
     def resolve_dependencies(self):
         """Resolve the dependencies of this file
@@ -166,24 +377,136 @@ class PyFile:
 
         Note: DO THIS STATICALLY. WITHOUT ACTUALLY IMPORTING ANY MODULES.
         """
-        with self.path.open("r", encoding="utf-8") as readfile:
-            ast_module = ast.parse(readfile.read(), str(self.path))
-        for item in ast.walk(ast_module):
-            if isinstance(item, ast.Import):
-                self.process_import(item)
-                self._raw_import.append(item)
-            elif isinstance(item, ast.ImportFrom):
-                for _name in item.names:
-                    self._add_library_dependency(item.module)
-                self.process_importfrom(item)
-                self._raw_importfrom.append(item)
+        self._resolve_imports()
 
         if self.depth == self.depth_limit:
             return
 
         self.resolve_recursive_dependencies()
 
+    def _resolve_imports(self):
+        """Gather the imports of this file alone
+
+        Kept apart from the recursion so that the source and its AST can be
+        freed before any imported files are visited.
+        """
+        cache_file = _cache_file(
+            self.cache_dir, self._resolved, self.include_stdlib_modules
+        )
+        stamp, fetched = (
+            self._fetched
+            if self._fetched is not None
+            else _fetch(self.path, cache_file)
+        )
+        self._fetched = None
+        if not isinstance(fetched, bytes):
+            self.library_dependencies.update(
+                map(sys.intern, fetched["library_dependencies"])
+            )
+            self.specific_submodules_imported.update(
+                map(sys.intern, fetched["specific_submodules_imported"])
+            )
+            return
+        ast_module = self._parse(fetched)
+        if ast_module is not None:
+            collector = _ImportCollector()
+            collector.visit(ast_module)
+            for item in collector.imports:
+                self.process_import(item)
+            for item in collector.importfroms:
+                self.process_importfrom(item)
+        if cache_file is not None:
+            self._store_cached(cache_file, stamp)
+
+    def _store_cached(self, cache_file: Path, stamp: List[int]):
+        """Save dependencies to the cache. This is best-effort only."""
+        cached = {
+            "stamp": stamp,
+            "library_dependencies": list(self.library_dependencies),
+            "specific_submodules_imported": list(self.specific_submodules_imported),
+        }
+        # Write to a temporary file first so that a concurrent run never
+        # reads a half-written entry.
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with tmp_file.open("w", encoding="utf-8") as writefile:
+                json.dump(cached, writefile)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            pass
+
+    def _parse(self, source: bytes) -> Optional[ast.AST]:
+        """Parse as little of the source as is needed to find its imports
+
+        Returns None if no line even looks like it could hold an import.
+        Otherwise only the source up to the end of the last such line is
+        parsed, falling back to the whole file if that slice isn't valid on
+        its own (e.g. it ends partway through a multi-line import).
+
+        >>> pyfile = PyFile(__file__, depth_limit=0)
+        >>> pyfile._parse(b"x = 1\\nprint('imports are important')\\n") is None
+        True
+        >>> ast.dump(pyfile._parse(b"import a\\nx = 1\\n"))
+        "Module(body=[Import(names=[alias(name='a')])], type_ignores=[])"
+        >>> len(pyfile._parse(b"from a import (\\n    b,\\n)\\nx = 1\\n").body)
+        2
+        >>> for source in [b"\\xef\\xbb\\xbfimport a\\n", b"\\x0cimport a\\n", b"x = 1\\rimport a\\r"]:
+        ...     print([type(item).__name__ for item in pyfile._parse(source).body])
+        ['Import']
+        ['Import']
+        ['Assign', 'Import']
+        """
+        if b"\r" in source and _BARE_CR_RE.search(source):
+            return _compile_ast(source, self._path_str)
+        last_import = None
+        for last_import in _IMPORT_RE.finditer(source):
+            pass
+        if last_import is None:
+            return None
+        end = source.find(b"\n", last_import.end())
+        if end != -1:
+            try:
+                return _compile_ast(source[: end + 1], self._path_str)
+            except SyntaxError:
+                pass
+        return _compile_ast(source, self._path_str)
+
     def resolve_recursive_dependencies(self):
+        """Resolve the dependencies of the files this one imports
+
+        Only exact stdlib names are skipped here, so local packages that
+        happen to share a name with a stdlib module are still followed.
+
+        >>> import tempfile
+        >>> with tempfile.TemporaryDirectory() as tmp:
+        ...     for name, text in [
+        ...         ("app/main.py", "import code.helpers\\nfrom code import util\\n"),
+        ...         ("code/__init__.py", ""),
+        ...         ("code/helpers.py", ""),
+        ...         ("code/util.py", ""),
+        ...     ]:
+        ...         Path(tmp, name).parent.mkdir(exist_ok=True)
+        ...         _ = Path(tmp, name).write_text(text)
+        ...     cwd = os.getcwd()
+        ...     os.chdir(tmp)
+        ...     try:
+        ...         print(sorted(PyFile("app/main.py").get_dependencies()))
+        ...     finally:
+        ...         os.chdir(cwd)
+        ['app/main.py', 'code/helpers.py', 'code/util.py']
+
+        Directory listings are only kept for one traversal, so a new one
+        sees files added since:
+
+        >>> with tempfile.TemporaryDirectory() as tmp:
+        ...     _ = Path(tmp, "a.py").write_text("import b\\n")
+        ...     before = PyFile(Path(tmp, "a.py")).imported_files
+        ...     _ = Path(tmp, "b.py").write_text("")
+        ...     after = PyFile(Path(tmp, "a.py")).imported_files
+        >>> len(before), len(after)
+        (0, 1)
+        """
         # We only check recursive dependencies in files that can be
         # found somewhere in this directory.
 
@@ -191,14 +514,22 @@ class PyFile:
         # with what the import module actually does wrt searching sys.PATH.
         # hashtag-best-effort
 
-        # Check all the modules from library_dependencies.
+        new_modules: List[Path] = []
+        # local lookups are cheaper in the loops below
+        stdlib = _STDLIB
+        listings = self._listings
+
+        # Check all the modules from library_dependencies. When the stdlib
+        # isn't included, _add_library_dependency has already filtered it out.
+        include_stdlib = self.include_stdlib_modules
         for module in self.library_dependencies:
-            if module not in sys.stdlib_module_names:
+            if not include_stdlib or module not in stdlib:
                 try:
                     # Check relative to the file itself. Examples:
                     #   - import import_test_1
-                    if Path(self.path.parent / f"{module}.py").exists():
-                        new_module = Path(self.path.parent / f"{module}.py")
+                    sibling = os.path.join(self._parent, f"{module}.py")
+                    if _exists(sibling, listings):
+                        module_file = sibling
                     # Check relative to the directory ast_import_checker is running from.
                     # This assumes that the module is in a similarly-named folder
                     # and one is running ast_import_checker from the root. Examples:
@@ -208,82 +539,363 @@ class PyFile:
                     # The reason why the latter works like the former is that
                     # both the above statements import a module named
                     # "ast_import_checker.import_test_X"
-                    elif Path(f"{module.replace('.', '/')}.py").exists():
-                        new_module = Path(f"{module.replace('.', '/')}.py")
+                    elif _exists(f"{module.replace('.', '/')}.py", listings):
+                        module_file = f"{module.replace('.', '/')}.py"
                     else:
                         continue
-                    self.imported_files[str(new_module)] = PyFile(
-                        path=new_module,
-                        depth=self.depth + 1,
-                        depth_limit=self.depth_limit,
-                        include_stdlib_modules=self.include_stdlib_modules,
-                    )
+                    new_modules.append(Path(module_file))
                 except Exception as err:
                     raise err
 
         for submodule in self.specific_submodules_imported:
-            if submodule not in sys.stdlib_module_names:
+            if submodule not in stdlib:
                 # Handle the case:
                 #   - from ast_import_checker import import_test_3
-                new_module = Path(f"{submodule.replace('.', '/')}.py")
-                if new_module.exists() and not new_module.is_dir():
-                    self.imported_files[str(new_module)] = PyFile(
-                        path=new_module,
-                        depth=self.depth + 1,
-                        depth_limit=self.depth_limit,
-                        include_stdlib_modules=self.include_stdlib_modules,
-                    )
+                module_file = f"{submodule.replace('.', '/')}.py"
+                if _exists(module_file, listings) and not os.path.isdir(module_file):
+                    new_modules.append(Path(module_file))
+
+        keys = [str(new_module.resolve()) for new_module in new_modules]
+        self._read_ahead(new_modules, keys)
+        for new_module, key in zip(new_modules, keys):
+            self.imported_files[str(new_module)] = self._get_pyfile(new_module, key)
+
+    def _read_ahead(self, new_modules: List[Path], keys: List[str]):
+        """Start fetching every file that hasn't been seen yet
+
+        That way each one is (hopefully) already in memory by the time it's
+        parsed. With the on-disk cache, only files whose entry is missing or
+        stale are read. Parsing itself stays on the calling thread, in order.
+        """
+        if self._executor is None:
+            return
+        # The reads are shared with the rest of the traversal, so a file that
+        # a nested recursion gets to first isn't read twice.
+        reads = self._reads
+        for new_module, key in zip(new_modules, keys):
+            if key not in self._cache and key not in reads:
+                reads[key] = self._executor.submit(
+                    _fetch,
+                    new_module,
+                    _cache_file(self.cache_dir, key, self.include_stdlib_modules),
+                )
+
+    def _get_pyfile(self, new_module: Path, key: str) -> "PyFile":
+        """Build the PyFile for an imported file, or reuse an existing one
+
+        A file that was first reached at a deeper level may not have been
+        recursed into as far as it would be from here, so bring its depth
+        up to date and resolve its imports again if needed.
+
+        Files that import each other are only built once:
+
+        >>> import tempfile
+        >>> with tempfile.TemporaryDirectory() as tmp:
+        ...     _ = Path(tmp, "a.py").write_text("import b\\n")
+        ...     _ = Path(tmp, "b.py").write_text("import a\\n")
+        ...     pyfile = PyFile(Path(tmp, "a.py"), depth_limit=5)
+        >>> sorted(Path(path).name for path in pyfile.get_dependencies())
+        ['a.py', 'b.py']
+        >>> pyfile.imported_files[str(Path(tmp, "b.py"))].imported_files[
+        ...     str(Path(tmp, "a.py"))
+        ... ] is pyfile
+        True
+
+        Here pkg/mod.py is first reached through b.py, at the depth limit,
+        and then straight from main.py, which lets it go on to pkg/leaf.py:
+
+        >>> with tempfile.TemporaryDirectory() as tmp:
+        ...     for name, text in [
+        ...         ("main.py", "import b\\nfrom pkg import mod\\n"),
+        ...         ("b.py", "from pkg import mod\\n"),
+        ...         ("pkg/mod.py", "import leaf\\n"),
+        ...         ("pkg/leaf.py", ""),
+        ...     ]:
+        ...         Path(tmp, name).parent.mkdir(exist_ok=True)
+        ...         _ = Path(tmp, name).write_text(text)
+        ...     cwd = os.getcwd()
+        ...     os.chdir(tmp)
+        ...     try:
+        ...         print(sorted(PyFile("main.py", depth_limit=2).get_dependencies()))
+        ...     finally:
+        ...         os.chdir(cwd)
+        ['b.py', 'main.py', 'pkg/leaf.py', 'pkg/mod.py']
+        """
+        depth = self.depth + 1
+        cached = self._cache.get(key)
+        if cached is None:
+            reads = self._reads
+            return type(self)(
+                path=new_module,
+                depth=depth,
+                depth_limit=self.depth_limit,
+                include_stdlib_modules=self.include_stdlib_modules,
+                cache_dir=self.cache_dir,
+                _cache=self._cache,
+                _listings=self._listings,
+                _executor=self._executor,
+                _fetched=reads.pop(key).result() if key in reads else None,
+                _reads=reads,
+            )
+        if depth < cached.depth:
+            cached.depth = depth
+            if cached.depth != cached.depth_limit:
+                cached.resolve_recursive_dependencies()
+        return cached
 
     def process_import(self, ast_import: ast.Import):
         for name in ast_import.names:
             self._add_library_dependency(name.name)
 
     def process_importfrom(self, ast_importfrom: ast.ImportFrom):
-        # these should be the same, but self.library_dependencies is a set
-        # so add it anyway
-        for name in ast_importfrom.names:
-            self._add_library_dependency(ast_importfrom.module)
-
+        self._add_library_dependency(ast_importfrom.module)
         for name in ast_importfrom.names:
             self.specific_submodules_imported.add(
-                f"{ast_importfrom.module}.{name.name}"
+                sys.intern(f"{ast_importfrom.module}.{name.name}")
             )
 
     def get_dependencies(
         self, dependencies: Optional[Dict[str, Dict[str, List[str]]]] = None
     ):
-        """Recursively grab dependencies of this and all imported files"""
+        """Recursively grab dependencies of this and all imported files
+
+        The lists are the caller's own, so changing them doesn't affect
+        later calls.
+
+        >>> pyfile = PyFile(__file__, depth_limit=0)
+        >>> pyfile.get_dependencies()[__file__]["library_dependencies"].sort(reverse=True)
+        >>> libraries = pyfile.get_dependencies()[__file__]["library_dependencies"]
+        >>> libraries == sorted(libraries)
+        True
+
+        Paths already in dependencies are walked (and overwritten) again:
+
+        >>> import tempfile
+        >>> with tempfile.TemporaryDirectory() as tmp:
+        ...     for name, text in [("a.py", "import b\\n"), ("b.py", "import c\\n"), ("c.py", "")]:
+        ...         _ = Path(tmp, name).write_text(text)
+        ...     deps = {}
+        ...     _ = PyFile(Path(tmp, "a.py"), depth_limit=1).get_dependencies(deps)
+        ...     _ = PyFile(Path(tmp, "b.py"), depth_limit=1).get_dependencies(deps)
+        >>> sorted(Path(path).name for path in deps)
+        ['a.py', 'b.py', 'c.py']
+        """
         deps: Dict[str, Dict[str, List[str]]] = {}
         if dependencies is not None:
             deps = dependencies
 
-        if str(self.path) not in deps:
-            deps[str(self.path)] = {}
-
-        deps[str(self.path)]["library_dependencies"] = sorted(
-            list(self.library_dependencies)
-        )
-        deps[str(self.path)]["specific_submodules_imported"] = sorted(
-            list(self.specific_submodules_imported)
-        )
-        for _module, pyfile in self.imported_files.items():
-            pyfile.get_dependencies(dependencies=deps)
+        for path, libraries, submodules in self.iter_dependencies():
+            deps[path] = {
+                "library_dependencies": list(libraries),
+                "specific_submodules_imported": list(submodules),
+            }
         return deps
 
+    def iter_dependencies(
+        self, seen: Optional[Set[str]] = None
+    ) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """Lazily yield the dependencies of this and all imported files
+
+        Yields (path, library_dependencies, specific_submodules_imported) for
+        each file in the same order get_dependencies lists them, skipping
+        (and adding to) the paths in seen. Unlike get_dependencies, the lists
+        are shared with the PyFile and must not be modified.
+
+        >>> pyfile = PyFile(__file__, include_stdlib_modules=False)
+        >>> dict(
+        ...     (path, [libraries, submodules])
+        ...     for path, libraries, submodules in pyfile.iter_dependencies()
+        ... ) == {
+        ...     path: list(deps.values())
+        ...     for path, deps in pyfile.get_dependencies().items()
+        ... }
+        True
+        """
+        if seen is None:
+            seen = set()
+        # Files imported from several places are shared, so only walk each once.
+        # Everything on the stack is a PyFile too, so its private state is ours.
+        # pylint: disable=protected-access
+        stack = [self]
+        while stack:
+            pyfile = stack.pop()
+            path = pyfile._path_str
+            if path in seen:
+                continue
+            seen.add(path)
+            yield (path, *pyfile._sorted_dependencies())
+            stack.extend(reversed(pyfile.imported_files.values()))
+
+    def _sorted_dependencies(self) -> Tuple[List[str], List[str]]:
+        """Sorted copies of library_dependencies/specific_submodules_imported"""
+        # The sets only ever grow, so a sorted copy of the same length is
+        # still up to date.
+        if self._sorted_libs is None or len(self._sorted_libs) != len(
+            self.library_dependencies
+        ):
+            self._sorted_libs = sorted(self.library_dependencies)
+        if self._sorted_subs is None or len(self._sorted_subs) != len(
+            self.specific_submodules_imported
+        ):
+            self._sorted_subs = sorted(self.specific_submodules_imported)
+        return self._sorted_libs, self._sorted_subs
+
+
+class _PyFileWithStdlib(PyFile):
+    """PyFile for include_stdlib_modules=True
+
+    Adds library dependencies without checking that setting for every name.
+
+    >>> _PyFileWithStdlib(__file__, depth_limit=0).get_dependencies() == PyFile(
+    ...     __file__, depth_limit=0
+    ... ).get_dependencies()
+    True
+    """
 
-def parse_imports(path: List[str], depth: int, ignore_stdlib: bool) -> int:
-    dependencies: Dict[str, Dict[str, List[str]]] = {}
-    for item in path:
-        pyfile = PyFile(
-            Path(item).expanduser(),
-            depth_limit=depth,
-            include_stdlib_modules=ignore_stdlib,
-        )
-        pyfile.get_dependencies(dependencies=dependencies)
-    print(json.dumps(dependencies, indent=4))
+    __slots__ = ()
+
+    def _add_library_dependency(self, name):
+        if name is not None:
+            self.library_dependencies.add(sys.intern(name))
+
+
+class _PyFileWithoutStdlib(PyFile):
+    """PyFile for include_stdlib_modules=False
+
+    Filters library dependencies without checking that setting for every name.
+
+    >>> _PyFileWithoutStdlib(
+    ...     __file__, depth_limit=0, include_stdlib_modules=False
+    ... ).get_dependencies() == PyFile(
+    ...     __file__, depth_limit=0, include_stdlib_modules=False
+    ... ).get_dependencies()
+    True
+    """
+
+    __slots__ = ()
+
+    def _add_library_dependency(self, name):
+        if name is not None and name.partition(".")[0] not in _STDLIB:
+            self.library_dependencies.add(sys.intern(name))
+
+
+def default_cache_dir() -> Path:
+    """Per-user cache directory, following the XDG base directory spec"""
+    return Path(os.environ.get("XDG_CACHE_HOME") or "~/.cache").expanduser() / (
+        "ast_import_checker"
+    )
+
+
+def parse_imports(
+    path: List[str], depth: int, ignore_stdlib: bool, cache_dir: Optional[str] = None
+) -> int:
+    # Resolve everything before writing anything, so that a bad path doesn't
+    # leave half a document on stdout.
+    pyfiles = _resolve_roots(
+        path, depth, ignore_stdlib, Path(cache_dir).expanduser() if cache_dir else None
+    )
+    seen: Set[str] = set()
+    # Write the results out one file at a time, rather than building up the
+    # whole document first. The output is the same as _dumps would give.
+    sys.stdout.write("{")
+    separator = "\n"
+    for pyfile in pyfiles:
+        for entry_path, libraries, submodules in pyfile.iter_dependencies(seen):
+            entry = _dumps(
+                {
+                    entry_path: {
+                        "library_dependencies": libraries,
+                        "specific_submodules_imported": submodules,
+                    }
+                }
+            )
+            # Drop the entry's own braces, leaving its indented contents.
+            sys.stdout.write(separator + entry[2:-2])
+            separator = ",\n"
+    sys.stdout.write("}\n" if not seen else "\n}\n")
     return 0
 
 
+def _resolve_roots(
+    path: List[str], depth: int, ignore_stdlib: bool, cache_dir: Optional[Path]
+) -> List[PyFile]:
+    """Build a PyFile for each of the given paths, sharing one traversal
+
+    A root that an earlier one already reached is reused, and followed as
+    far as it would be as a root of its own:
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     for name, text in [("a.py", "import b\\n"), ("b.py", "import c\\n"), ("c.py", "")]:
+    ...         _ = Path(tmp, name).write_text(text)
+    ...     pyfiles = _resolve_roots(
+    ...         [str(Path(tmp, "a.py")), str(Path(tmp, "b.py"))], 1, True, None
+    ...     )
+    >>> seen = set()
+    >>> [
+    ...     Path(path).name
+    ...     for pyfile in pyfiles
+    ...     for path, _, _ in pyfile.iter_dependencies(seen)
+    ... ]
+    ['a.py', 'b.py', 'c.py']
+    """
+    cache: Dict[str, PyFile] = {}
+    listings: Dict[str, FrozenSet[str]] = {}
+    # Pick the PyFile flavour for this setting once, up front.
+    pyfile_class = _PyFileWithStdlib if ignore_stdlib else _PyFileWithoutStdlib
+    with ThreadPoolExecutor() as executor:
+        # Start fetching all the files we were given straight away, so that
+        # each is ready by the time the ones before it have been traversed.
+        paths = [Path(item).expanduser() for item in path]
+        keys = [str(item.resolve()) for item in paths]
+        reads: Dict[str, Future] = {}
+        for item, key in zip(paths, keys):
+            if key not in reads:
+                reads[key] = executor.submit(
+                    _fetch, item, _cache_file(cache_dir, key, ignore_stdlib)
+                )
+        pyfiles = []
+        for item, key in zip(paths, keys):
+            pyfile = cache.get(key)
+            if pyfile is None:
+                # Each read is dropped as it's used, so only the files still
+                # waiting to be traversed are held in memory.
+                pyfile = pyfile_class(
+                    item,
+                    depth_limit=depth,
+                    include_stdlib_modules=ignore_stdlib,
+                    cache_dir=cache_dir,
+                    _cache=cache,
+                    _listings=listings,
+                    _executor=executor,
+                    _fetched=reads.pop(key).result() if key in reads else None,
+                    _reads=reads,
+                )
+            elif pyfile.depth > 0:
+                # Already reached through an earlier root, but maybe not as
+                # far as it would be reached from here.
+                pyfile.depth = 0
+                if pyfile.depth != pyfile.depth_limit:
+                    pyfile.resolve_recursive_dependencies()
+            pyfiles.append(pyfile)
+        return pyfiles
+
+
+def _dumps(dependencies: Dict[str, Dict[str, List[str]]]) -> str:
+    """Serialize dependencies as JSON, indented by four spaces
+
+    >>> print(_dumps({"a.py": {"library_dependencies": ["b"]}}))
+    {
+        "a.py": {
+            "library_dependencies": [
+                "b"
+            ]
+        }
+    }
+    """
+    return json.dumps(dependencies, indent=4)
+
+
 def test():
     """Run tests
 
@@ -327,6 +939,20 @@ def main():
         help="Whether or not to ignore the stdlib",
         action="store_false",
     )
+    cli_parser.add_argument(
+        "-c",
+        "--cache_dir",
+        help="Where to cache each file's dependencies between runs",
+        type=str,
+        default=str(default_cache_dir()),
+    )
+    cli_parser.add_argument(
+        "--no_cache",
+        help="Don't cache dependencies between runs",
+        dest="cache_dir",
+        action="store_const",
+        const=None,
+    )
     cli_parser.set_defaults(run=parse_imports)
 
     cli_parser = modes.add_parser("test", help="Run the tests")